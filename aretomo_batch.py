@@ -8,21 +8,33 @@ Usage:
 """
 
 import argparse
+import asyncio
 import json
 import logging
+import os
 import shutil
 import subprocess
 import sys
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Tuple, Dict, Any
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 try:
     from tqdm import tqdm
 except ImportError:
     sys.exit("Please install tqdm: pip install tqdm")
 
+try:
+    import orjson  # optional, much faster JSON serialization
+except ImportError:
+    orjson = None  # type: ignore
+
+# Environment variables passed on to AreTomo (matched by prefix)
+CHILD_ENV_PREFIXES = ("PATH", "LD_", "HOME", "USER", "CUDA_", "TMPDIR")
+
+# Read size when tee'ing AreTomo output to the console
+TEE_CHUNK_SIZE = 64 * 1024
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -30,6 +42,18 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def write_json(obj: Any, path: Path) -> None:
+    """Write obj as indented UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        path.write_bytes(
+            orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        )
+    else:
+        path.write_text(
+            json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8"
+        )
+
+
 def parse_args() -> argparse.Namespace:
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(
@@ -112,15 +136,31 @@ def setup_environment() -> bool:
         return False
 
 
+def _walk_tilt_series(directory: str) -> Iterator[Tuple[Path, Path]]:
+    """Yield .st + .rawtlt pairs below directory using a single scandir per dir."""
+    try:
+        with os.scandir(directory) as it:
+            entries = list(it)
+    except OSError as e:
+        logger.warning("Cannot scan %s: %s", directory, e)
+        return
+
+    names = {entry.name for entry in entries if entry.is_file()}
+    for entry in entries:
+        if entry.name.endswith(".st") and entry.name in names:
+            if entry.name[:-3] + ".rawtlt" in names:
+                yield Path(entry.path), Path(entry.path[:-3] + ".rawtlt")
+            else:
+                logger.warning("Found %s but no matching .rawtlt file", entry.path)
+
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _walk_tilt_series(entry.path)
+
+
 def find_tilt_series(root: Path) -> List[Tuple[Path, Path]]:
     """Recursively find .st + .rawtlt file pairs."""
-    pairs = []
-    for st_file in root.rglob("*.st"):
-        tlt_file = st_file.with_suffix(".rawtlt")
-        if tlt_file.exists():
-            pairs.append((st_file, tlt_file))
-        else:
-            logger.warning("Found %s but no matching .rawtlt file", st_file)
+    pairs = list(_walk_tilt_series(os.fspath(root)))
 
     if not pairs:
         logger.error("No *.st + *.rawtlt pairs found in %s", root)
@@ -128,18 +168,40 @@ def find_tilt_series(root: Path) -> List[Tuple[Path, Path]]:
     return sorted(pairs)
 
 
+def minimal_environment() -> Dict[str, str]:
+    """Return the subset of os.environ that AreTomo needs to run."""
+    return {k: v for k, v in os.environ.items() if k.startswith(CHILD_ENV_PREFIXES)}
+
+
+def cuda_device(gpu: int, visible: Optional[str]) -> str:
+    """Map a -g GPU index to a CUDA_VISIBLE_DEVICES value.
+
+    If the parent already restricts the visible devices (e.g. under SLURM),
+    the index refers to that list rather than to the physical GPU.
+    """
+    if visible:
+        devices = visible.split(",")
+        if 0 <= gpu < len(devices):
+            return devices[gpu].strip()
+    return str(gpu)
+
+
 def build_aretomo_command(
-    st: Path, tlt: Path, out_stem: Path, gpu: int, args: argparse.Namespace
+    st: str, tlt: str, out_mrc: str, args: argparse.Namespace
 ) -> List[str]:
-    """Build the AreTomo command line arguments."""
+    """Build the AreTomo command line arguments.
+
+    The GPU is selected through CUDA_VISIBLE_DEVICES, so AreTomo always
+    sees a single device and is told to use -Gpu 0.
+    """
     cmd = [
         args.aretomo,
         "-InMrc",
-        str(st),
+        st,
         "-OutMrc",
-        str(out_stem.with_suffix(".mrc")),
+        out_mrc,
         "-AngFile",
-        str(tlt),
+        tlt,
         "-VolZ",
         str(args.vol_z),
         "-Align",
@@ -151,7 +213,7 @@ def build_aretomo_command(
         "-OutImod",
         "2",
         "-Gpu",
-        str(gpu),
+        "0",
     ]
 
     if args.align_z:
@@ -162,88 +224,152 @@ def build_aretomo_command(
     return cmd
 
 
-def run_single_aretomo(
-    st: Path,
-    tlt: Path,
-    out_stem: Path,
+async def run_single_aretomo(
+    st: str,
+    tlt: str,
+    out_mrc: str,
+    log_file: str,
+    stem: str,
     gpu: int,
     args: argparse.Namespace,
     show_log: bool = False,
+    base_env: Optional[Dict[str, str]] = None,
 ) -> Tuple[bool, str]:
-    """Run AreTomo on a single tilt series."""
-    log_dir = out_stem.parent / "logs"
-    log_dir.mkdir(parents=True, exist_ok=True)
-    log_file = log_dir / f"{st.stem}.log"
-    final_mrc = out_stem.with_suffix(".mrc")
+    """Run AreTomo on a single tilt series.
 
-    # Skip existing if requested
-    if args.skip_existing and final_mrc.exists():
-        logger.info("Skipping existing output: %s", final_mrc)
-        return True, str(log_file)
+    Paths are plain strings precomputed by main(), so nothing here has to
+    build Path objects per series.
+    """
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
 
-    cmd = build_aretomo_command(st, tlt, out_stem, gpu, args)
+    cmd = build_aretomo_command(st, tlt, out_mrc, args)
+    env = dict(os.environ if base_env is None else base_env)
+    env["CUDA_VISIBLE_DEVICES"] = cuda_device(gpu, env.get("CUDA_VISIBLE_DEVICES"))
+    cmd_line = f"CUDA_VISIBLE_DEVICES={env['CUDA_VISIBLE_DEVICES']} " + " ".join(cmd)
 
     # Dry run: just print the command
     if args.dry_run:
-        logger.info("Would run: %s", " ".join(cmd))
+        logger.info("Would run: %s", cmd_line)
         return True, "Dry run - no execution"
 
     # Run the command with retries
     for attempt in range(args.max_retries + 1):
         if attempt > 0:
-            logger.info("Retry %d/%d for %s", attempt, args.max_retries, st.stem)
-            time.sleep(5)  # Brief pause before retry
+            logger.info("Retry %d/%d for %s", attempt, args.max_retries, stem)
+            await asyncio.sleep(5)  # Brief pause before retry
 
         try:
-            with log_file.open("w") as log_handle:
-                log_handle.write(" ".join(cmd) + "\n\n")
-
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True,
-                )
-
-                # Stream output to log and optionally to console
-                for line in process.stdout:  # type: ignore
-                    log_handle.write(line)
+            if show_log:
+                # Tee raw output bytes to log and console, without decoding
+                with open(log_file, "wb") as log_handle:
+                    log_handle.write((cmd_line + "\n\n").encode())
+                    process = await asyncio.create_subprocess_exec(
+                        *cmd,
+                        env=env,
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.STDOUT,
+                    )
+                    # read() returns whatever is available, so output stays live
+                    while chunk := await process.stdout.read(TEE_CHUNK_SIZE):  # type: ignore
+                        log_handle.write(chunk)
+                        sys.stdout.buffer.write(chunk)
+                        sys.stdout.flush()
+                    returncode = await process.wait()
+            else:
+                # Let the child write straight into the log file
+                with open(log_file, "wb") as log_handle:
+                    log_handle.write((cmd_line + "\n\n").encode())
                     log_handle.flush()
-                    if show_log:
-                        print(line, end="")
-
-                process.wait()
-
-                # Check for success
-                if process.returncode == 0 and final_mrc.exists():
-                    logger.info("Successfully processed %s", st.stem)
-                    return True, str(log_file)
-                else:
-                    logger.warning(
-                        "Process failed for %s (return code: %d)",
-                        st.stem,
-                        process.returncode,
+                    process = await asyncio.create_subprocess_exec(
+                        *cmd,
+                        env=env,
+                        stdout=log_handle,
+                        stderr=asyncio.subprocess.STDOUT,
                     )
+                    returncode = await process.wait()
+
+            # Check for success
+            if returncode == 0 and os.path.exists(out_mrc):
+                logger.info("Successfully processed %s", stem)
+                return True, log_file
+            else:
+                logger.warning(
+                    "Process failed for %s (return code: %d)",
+                    stem,
+                    returncode,
+                )
 
         except (OSError, subprocess.SubprocessError) as e:
-            logger.error("Error running AreTomo for %s: %s", st.stem, e)
+            logger.error("Error running AreTomo for %s: %s", stem, e)
+
+    return False, log_file
+
 
-    return False, str(log_file)
+async def run_on_free_gpu(
+    task: Tuple[Any, ...],
+    gpu_slots: "asyncio.Queue[int]",
+    base_env: Dict[str, str],
+) -> Tuple[str, bool, str]:
+    """Wait for a free GPU slot, run one task on it and release the slot."""
+    st, tlt, out_mrc, log_file, stem, args, show_log = task
+    gpu = await gpu_slots.get()
+    try:
+        success, log_path = await run_single_aretomo(
+            st, tlt, out_mrc, log_file, stem, gpu, args, show_log, base_env
+        )
+    except Exception as e:
+        logger.error("Task %s failed with exception: %s", stem, e)
+        success, log_path = False, str(e)
+    finally:
+        gpu_slots.put_nowait(gpu)
+    return stem, success, log_path
+
+
+async def process_tasks(
+    tasks: List[Tuple[Any, ...]],
+    gpu_list: List[int],
+    n_slots: int,
+    base_env: Dict[str, str],
+) -> List[Tuple[str, bool, str]]:
+    """Run all tasks from one event loop, at most n_slots at a time.
+
+    The GPU slot queue acts as the concurrency semaphore: each permit is a
+    GPU id, taken when a series starts and returned when it finishes, so
+    faster GPUs naturally pick up more tilt-series.
+    """
+    gpu_slots: "asyncio.Queue[int]" = asyncio.Queue()
+    for i in range(n_slots):
+        gpu_slots.put_nowait(gpu_list[i % len(gpu_list)])
+
+    # Create the tasks up front so they queue for GPU slots in series order
+    pending = [
+        asyncio.create_task(run_on_free_gpu(task, gpu_slots, base_env))
+        for task in tasks
+    ]
+
+    results = []
+    with tqdm(total=len(tasks), desc="Processing tilt series", unit="series") as pbar:
+        for next_done in asyncio.as_completed(pending):
+            results.append(await next_done)
+            pbar.update(1)
+    return results
 
 
 def main() -> None:
     """Main function to coordinate batch processing."""
+    t0 = time.perf_counter()
     args = parse_args()
 
     # Set logging level
     logging.getLogger().setLevel(getattr(logging, args.log_level))
 
-    # Check if AreTomo is available
-    if not args.dry_run and not shutil.which(args.aretomo):
+    # Check if AreTomo is available, and resolve it once to an absolute path
+    # so every launch can exec it directly instead of searching $PATH
+    aretomo_path = shutil.which(args.aretomo)
+    if not args.dry_run and not aretomo_path:
         logger.error("AreTomo2 executable not found: %s", args.aretomo)
         sys.exit(1)
+    args.aretomo = aretomo_path or args.aretomo
 
     # Setup environment
     if not args.dry_run:
@@ -271,46 +397,66 @@ def main() -> None:
 
     logger.info("Found %d tilt series to process", len(tilt_series_pairs))
 
-    # Prepare tasks
+    # Skip existing if requested, before any work is scheduled
+    skipped = 0
+    if args.skip_existing:
+        pending = []
+        for st_path, tlt_path in tilt_series_pairs:
+            final_mrc = (
+                out_dir / st_path.parent.relative_to(imod_dir) / (st_path.stem + ".mrc")
+            )
+            if final_mrc.exists():
+                logger.info("Skipping existing output: %s", final_mrc)
+            else:
+                pending.append((st_path, tlt_path))
+        skipped = len(tilt_series_pairs) - len(pending)
+        tilt_series_pairs = pending
+        logger.info(
+            "Skipped %d existing tilt series, %d left to process",
+            skipped,
+            len(tilt_series_pairs),
+        )
+
+    # Concurrent job slots, spread across GPUs
     gpu_list = list(map(int, args.gpus.split(",")))
+    n_slots = max(1, args.jobs)
+
+    # Prepare tasks; all per-series paths are built once here as strings
     tasks = []
 
     for i, (st_path, tlt_path) in enumerate(tilt_series_pairs):
-        out_stem = out_dir / st_path.parent.relative_to(imod_dir) / st_path.stem
-        gpu = gpu_list[i % len(gpu_list)]
+        stem = st_path.stem
+        series_dir = os.fspath(out_dir / st_path.parent.relative_to(imod_dir))
+        out_mrc = os.path.join(series_dir, stem + ".mrc")
+        log_file = os.path.join(series_dir, "logs", stem + ".log")
         show_log = (
             args.show_output and i == 0
         )  # Only show output for first task if requested
 
-        tasks.append((st_path, tlt_path, out_stem, gpu, args, show_log))
+        tasks.append(
+            (
+                os.fspath(st_path),
+                os.fspath(tlt_path),
+                out_mrc,
+                log_file,
+                stem,
+                args,
+                show_log,
+            )
+        )
 
     # Process tasks
     success_list = []
     failure_list = []
 
-    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
-        # Submit all tasks
-        future_to_name = {
-            executor.submit(run_single_aretomo, *task): task[0].stem for task in tasks
-        }
-
-        # Process results as they complete
-        with tqdm(
-            total=len(tasks), desc="Processing tilt series", unit="series"
-        ) as pbar:
-            for future in as_completed(future_to_name):
-                name = future_to_name[future]
-                try:
-                    success, log_path = future.result()
-                    if success:
-                        success_list.append((name, log_path))
-                    else:
-                        failure_list.append((name, log_path))
-                except Exception as e:
-                    logger.error("Task %s failed with exception: %s", name, e)
-                    failure_list.append((name, str(e)))
-                finally:
-                    pbar.update(1)
+    base_env = minimal_environment()
+    for name, success, log_path in asyncio.run(
+        process_tasks(tasks, gpu_list, n_slots, base_env)
+    ):
+        if success:
+            success_list.append((name, log_path))
+        else:
+            failure_list.append((name, log_path))
 
     # Generate summary
     logger.info(
@@ -327,6 +473,7 @@ def main() -> None:
     # Save summary to JSON
     summary: Dict[str, Any] = {
         "total": len(tasks),
+        "skipped": skipped,
         "successful": len(success_list),
         "failed": len(failure_list),
         "failed_series": [
@@ -334,13 +481,12 @@ def main() -> None:
         ],
         "command_args": vars(args),
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "processing_time": time.process_time(),
+        "elapsed_seconds": round(time.perf_counter() - t0, 2),  # wall clock
     }
 
     summary_file = out_dir / "processing_summary.json"
     try:
-        with summary_file.open("w", encoding="utf-8") as f:
-            json.dump(summary, f, indent=2, ensure_ascii=False)
+        write_json(summary, summary_file)
         logger.info("Summary saved to %s", summary_file)
     except IOError as e:
         logger.error("Failed to save summary: %s", e)
@@ -43,11 +43,101 @@ After running, you will have:
 
 import argparse
 import json
+import os
 import shutil
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import orjson  # optional, much faster JSON serialization
+except ImportError:
+    orjson = None  # type: ignore
+
+
+def write_json(obj, path):
+    """Write obj as indented UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        path.write_bytes(
+            orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        )
+    else:
+        path.write_text(
+            json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8"
+        )
+
+
+# Rename rules for files inside *_Imod/, relative to the series stem.
+# Generic IMOD command files get the stem prepended ...
+STEM_PREFIX_RENAMES = {
+    "newst.com": "_newst.com",
+    "tilt.com": "_tilt.com",
+}
+# ... and "<stem>_st<suffix>" files drop the "_st".
+STEM_SUFFIX_RENAMES = {
+    "_st_order_list.csv": "_order_list.csv",
+    "_st.tlt": ".tlt",
+    "_st.xf": ".xf",
+    "_st.xtilt": ".xtilt",
+}
+
+
+def rename_for(name, stem):
+    """Return the Warp-friendly name for an *_Imod/ file of series stem."""
+    if name in STEM_PREFIX_RENAMES:
+        return stem + STEM_PREFIX_RENAMES[name]
+    if name.startswith(stem):
+        new_suffix = STEM_SUFFIX_RENAMES.get(name[len(stem) :])
+        if new_suffix is not None:
+            return stem + new_suffix
+    return name
+
+
+def move(src, dst):
+    """Move src to dst with a single rename, falling back to shutil.move.
+
+    The fallback covers cross-filesystem moves and a directory being moved
+    onto an existing non-empty directory.
+    """
+    try:
+        os.replace(src, dst)
+    except OSError:
+        shutil.move(str(src), str(dst))
+
+
+def apply_op(op):
+    """Apply a single ("mv" | "rm", src, dst) op; return it, or None on failure."""
+    kind, src, dst = op
+    if kind == "rm":
+        try:
+            src.unlink()
+        except Exception as e:
+            print(f"Failed to delete {src}: {e}")
+            return None
+    else:
+        move(src, dst)
+    return op
+
+
+def apply_ops(ops, jobs, deleted, moved_src, moved_dst):
+    """Apply ops concurrently and record the completed ones.
+
+    Deleted paths go to deleted; moves go to the parallel moved_src and
+    moved_dst lists. Results are recorded in submission order, so the
+    summary does not depend on thread scheduling.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        for done in executor.map(apply_op, ops):
+            if done is None:
+                continue
+            kind, src, dst = done
+            if kind == "rm":
+                deleted.append(os.fspath(src))
+            else:
+                moved_src.append(os.fspath(src))
+                moved_dst.append(os.fspath(dst))
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -66,6 +156,16 @@ def parse_args():
             "The script will process all *_Imod/ directories and related files inside this root."
         ),
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=32,
+        help=(
+            "Number of concurrent file operations (default: 32).\n"
+            "High values help on parallel filesystems such as Lustre or BeeGFS."
+        ),
+    )
     return parser.parse_args()
 
 
@@ -75,8 +175,16 @@ def main():
     if not root.is_dir():
         sys.exit(f"Directory not found: {root}")
 
+    # Remember directories already created so each is mkdir'ed only once
+    created_dirs = set()
+
+    def ensure_dir(d):
+        if d not in created_dirs:
+            d.mkdir(parents=True, exist_ok=True)
+            created_dirs.add(d)
+
     imod_root = root / "imod"
-    imod_root.mkdir(exist_ok=True)
+    ensure_dir(imod_root)
 
     summary = {
         "processed": [],
@@ -84,86 +192,95 @@ def main():
         "moved": [],
         "imod_dirs": [],
     }
+    # Moves are kept as two parallel columns of plain strings and only
+    # turned into {"src", "dst"} records when the summary is written.
+    deleted = summary["deleted"]
+    moved_src, moved_dst = [], []
 
-    # ---------- Process *_Imod directories ----------
-    for imod_dir in root.glob("**/*_Imod"):
-        if not imod_dir.is_dir():
-            continue
+    # ---------- Walk the tree once ----------
+    # *_Imod/ dirs and imod/ itself are pruned from the walk: the former are
+    # handled as a whole below, the latter already holds reorganized files.
+    imod_dirs, aln_files, mrc_files, log_dirs = [], [], [], []
+    for dirpath, dirnames, filenames in os.walk(root):
+        parent = Path(dirpath)
+        for fn in filenames:
+            if fn.endswith(".aln"):
+                aln_files.append(parent / fn)
+            elif fn.endswith(".mrc"):
+                mrc_files.append(parent / fn)
+        for dn in list(dirnames):
+            if dn.endswith("_Imod"):
+                imod_dirs.append(parent / dn)
+                dirnames.remove(dn)
+            elif parent / dn == imod_root:
+                dirnames.remove(dn)
+            elif dn == "logs":
+                log_dirs.append(parent / dn)
 
+    # ---------- Process *_Imod directories ----------
+    imod_ops = []
+    for imod_dir in imod_dirs:
         stem = imod_dir.name.replace("_Imod", "")  # e.g. Position_16
         tgt_dir = imod_root / stem
-        tgt_dir.mkdir(exist_ok=True)
+        ensure_dir(tgt_dir)
         summary["imod_dirs"].append(str(imod_dir))
 
-        # File rename rules
-        rename_map = {
-            "newst.com": f"{stem}_newst.com",
-            "tilt.com": f"{stem}_tilt.com",
-            f"{stem}_st_order_list.csv": f"{stem}_order_list.csv",
-            f"{stem}_st.tlt": f"{stem}.tlt",
-            f"{stem}_st.xf": f"{stem}.xf",
-            f"{stem}_st.xtilt": f"{stem}.xtilt",
-        }
-
         for src in imod_dir.iterdir():
             # Remove *_st.mrc
             if src.suffix == ".mrc" and "_st" in src.stem:
-                try:
-                    src.unlink()
-                    summary["deleted"].append(str(src))
-                except Exception as e:
-                    print(f"Failed to delete {src}: {e}")
+                imod_ops.append(("rm", src, None))
                 continue
 
             # Rename and move
-            new_name = rename_map.get(src.name, src.name)
-            dst = tgt_dir / new_name
-            shutil.move(str(src), str(dst))
-            summary["moved"].append({"src": str(src), "dst": str(dst)})
+            new_name = rename_for(src.name, stem)
+            imod_ops.append(("mv", src, tgt_dir / new_name))
+
+    apply_ops(imod_ops, args.jobs, deleted, moved_src, moved_dst)
 
-        # Remove empty _Imod directory
+    # Remove empty _Imod directories
+    for imod_dir in imod_dirs:
         try:
             imod_dir.rmdir()
-            summary["deleted"].append(str(imod_dir))
+            deleted.append(os.fspath(imod_dir))
         except OSError:
             pass
 
-    # ---------- Collect .aln files ----------
-    for aln in root.rglob("*.aln"):
+    # ---------- Collect .aln and .mrc files ----------
+    file_ops = []
+    for aln in aln_files:
         stem = aln.stem.replace(".st", "")  # Position_16.st.aln → Position_16
         pos_dir = root / stem
-        pos_dir.mkdir(exist_ok=True)
-        dst = pos_dir / aln.name
-        shutil.move(str(aln), str(dst))
-        summary["moved"].append({"src": str(aln), "dst": str(dst)})
-
-    # ---------- Collect .mrc files ----------
-    for mrc in root.rglob("*.mrc"):
-        if mrc.is_relative_to(imod_root):
+        ensure_dir(pos_dir)
+        file_ops.append(("mv", aln, pos_dir / aln.name))
+
+    imod_root_prefix = os.fspath(imod_root) + os.sep
+    for mrc in mrc_files:
+        if os.fspath(mrc).startswith(imod_root_prefix):
             continue  # skip files already in imod/
         stem = mrc.stem
         pos_dir = root / stem
-        pos_dir.mkdir(exist_ok=True)
-        dst = pos_dir / mrc.name
-        shutil.move(str(mrc), str(dst))
-        summary["moved"].append({"src": str(mrc), "dst": str(dst)})
+        ensure_dir(pos_dir)
+        file_ops.append(("mv", mrc, pos_dir / mrc.name))
+
+    apply_ops(file_ops, args.jobs, deleted, moved_src, moved_dst)
 
     # ---------- Move logs ----------
-    for log_dir in root.rglob("logs"):
-        if not log_dir.is_dir():
-            continue
+    log_ops = []
+    for log_dir in log_dirs:
         stem = log_dir.parent.name
         pos_dir = root / stem
-        pos_dir.mkdir(exist_ok=True)
+        ensure_dir(pos_dir)
         tgt_logs = pos_dir / "logs"
         if log_dir != tgt_logs:
-            shutil.move(str(log_dir), str(tgt_logs))
-            summary["moved"].append({"src": str(log_dir), "dst": str(tgt_logs)})
+            log_ops.append(("mv", log_dir, tgt_logs))
+
+    apply_ops(log_ops, args.jobs, deleted, moved_src, moved_dst)
 
     # ---------- Write summary ----------
+    summary["moved"] = [{"src": s, "dst": d} for s, d in zip(moved_src, moved_dst)]
     summary["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S")  # type: ignore
     summary_file = root / "cleanup_summary.json"
-    summary_file.write_text(json.dumps(summary, indent=2, ensure_ascii=False))
+    write_json(summary, summary_file)
     print(f"Cleanup finished! Summary written to {summary_file}")
 
 